@@ -31,12 +31,30 @@ class TestCase(tf.test.TestCase, absltest.TestCase):
     tf.keras.backend.clear_session()
 
 
+_v2_behavior_enabled = False
+
+
+def enable_v2_behavior():
+  """Enables TF 2.0 behavior, unless this has already been done.
+
+  Test modules call this at import time, so that their module-level
+  computations are traced with TF 2.0 behavior. Calls after the first do
+  nothing, so the global TensorFlow context is not reconfigured each time a
+  test module is loaded when many test modules are run together.
+  """
+  global _v2_behavior_enabled
+  if _v2_behavior_enabled:
+    return
+  tf.compat.v1.enable_v2_behavior()
+  _v2_behavior_enabled = True
+
+
 def main():
   """Runs all unit tests with TF 2.0 features enabled.
 
   This function should only be used if TensorFlow code is being tested.
   """
-  tf.compat.v1.enable_v2_behavior()
+  enable_v2_behavior()
   tf.test.main()
 
 
@@ -18,6 +18,10 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from unittest import mock
+
+import tensorflow as tf
+
 from tensorflow_federated.python.common_libs import test
 
 
@@ -34,6 +38,13 @@ class TestUtilsTest(test.TestCase):
     with self.assertRaises(ValueError):
       test.assert_nested_struct_eq({'a': 10}, {'a': False})
 
+  def test_enable_v2_behavior_does_nothing_when_called_again(self):
+    test.enable_v2_behavior()
+    with mock.patch.object(tf.compat.v1, 'enable_v2_behavior') as enable:
+      test.enable_v2_behavior()
+    enable.assert_not_called()
+    self.assertTrue(tf.executing_eagerly())
+
 
 if __name__ == '__main__':
   test.main()
@@ -37,6 +37,13 @@ from tensorflow_federated.python.core.impl import executor_service_utils
 from tensorflow_federated.python.core.impl import executor_value_base
 
 
+def _all_tasks(loop):
+  # `asyncio.all_tasks` is only available as of Python 3.7.
+  if hasattr(asyncio, 'all_tasks'):
+    return asyncio.all_tasks(loop)
+  return asyncio.Task.all_tasks(loop)
+
+
 class ExecutorService(executor_pb2_grpc.ExecutorServicer):
   """A wrapper around a target executor that makes it into a gRPC service.
 
@@ -57,6 +64,14 @@ class ExecutorService(executor_pb2_grpc.ExecutorServicer):
 
     def run_loop(loop):
       loop.run_forever()
+      # Cancel whatever is still pending, so that the callers waiting on those
+      # results are released, rather than blocked forever on a stopped loop.
+      pending = [task for task in _all_tasks(loop) if not task.done()]
+      for task in pending:
+        task.cancel()
+      if pending:
+        loop.run_until_complete(
+            asyncio.gather(*pending, return_exceptions=True))
       loop.close()
 
     self._event_loop = asyncio.new_event_loop()
@@ -65,6 +80,16 @@ class ExecutorService(executor_pb2_grpc.ExecutorServicer):
     self._thread.start()
 
   def __del__(self):
+    self.close()
+
+  def close(self):
+    """Stops the event loop that runs the executor, and waits for its thread.
+
+    Any coroutines still pending on the event loop are cancelled. Once this
+    has returned the event loop is closed, and further calls do nothing.
+    """
+    if self._event_loop.is_closed():
+      return
     self._event_loop.call_soon_threadsafe(self._event_loop.stop)
     self._thread.join()
 
@@ -18,19 +18,25 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import asyncio
+from concurrent import futures
+import functools
+import itertools
+import os
 import threading
+import weakref
 
 from absl.testing import absltest
+from absl.testing import parameterized
 
 import grpc
-from grpc.framework.foundation import logging_pool
-import portpicker
 
 import tensorflow as tf
 
 from tensorflow_federated.proto.v0 import executor_pb2
 from tensorflow_federated.proto.v0 import executor_pb2_grpc
 from tensorflow_federated.python.common_libs import py_typecheck
+from tensorflow_federated.python.common_libs import test
 from tensorflow_federated.python.core.api import computations
 from tensorflow_federated.python.core.impl import eager_executor
 from tensorflow_federated.python.core.impl import executor_base
@@ -38,48 +44,266 @@ from tensorflow_federated.python.core.impl import executor_service
 from tensorflow_federated.python.core.impl import executor_service_utils
 from tensorflow_federated.python.core.impl import executor_value_base
 
+test.enable_v2_behavior()
+
+
+# Used by both the server and the channels: widens the HTTP/2 flow control
+# windows, so that larger values don't stall waiting on window updates. No
+# keepalive time is set, so no keepalive pings are sent on idle connections.
+_GRPC_OPTIONS = [
+    ('grpc.http2.initial_connection_window_size', 8 * 1024 * 1024),
+    ('grpc.http2.initial_stream_window_size', 8 * 1024 * 1024),
+]
+
+
+def _close_channel(channel):
+  # TODO(b/134543154): Find some way of cleanly disposing of channels that is
+  # consistent between Google-internal and OSS stacks.
+  try:
+    channel.close()
+  except AttributeError:
+    # The `.close()` method does not appear to be present in grpcio 1.8.6, so
+    # we have to fall back on the destructor to release the channel.
+    pass
+
+
+class _ChannelPool(object):
+  """A fixed set of channels to a single target, handed out round-robin.
+
+  Each channel is given a distinct `grpc.channel_number` argument, so that
+  gRPC does not collapse them into a single shared connection, and concurrent
+  RPCs do not contend for the flow control window of one HTTP/2 connection.
+  """
+
+  def __init__(self, target, num_channels=4):
+    self._channels = [
+        grpc.insecure_channel(
+            target, options=_GRPC_OPTIONS + [('grpc.channel_number', i)])
+        for i in range(num_channels)
+    ]
+    self._stubs = [executor_pb2_grpc.ExecutorStub(c) for c in self._channels]
+    self._counter = itertools.count()
+
+  def stub(self):
+    """Returns a stub bound to the next channel in the pool."""
+    return self._stubs[next(self._counter) % len(self._stubs)]
+
+  def close(self):
+    for channel in self._channels:
+      _close_channel(channel)
+    del self._stubs
+    del self._channels
+
+
+@computations.tf_computation
+def _return_ten():
+  return tf.constant(10)
+
+
+@computations.tf_computation(tf.int32)
+def _add_one(x):
+  return tf.add(x, 1)
+
+
+@functools.lru_cache(maxsize=None, typed=True)
+def _serialize_value(value, type_spec=None):
+  value_proto, _ = executor_service_utils.serialize_value(value, type_spec)
+  return value_proto.SerializeToString()
+
+
+def _create_value_proto(value, type_spec=None):
+  """Returns a fresh `executor_pb2.Value` for `value`, serialized only once."""
+  return executor_pb2.Value.FromString(_serialize_value(value, type_spec))
+
+
+class _InProcessRpcError(grpc.RpcError):
+  """The error raised when an in-process call sets a non-OK status code."""
+
+  def __init__(self, code, details):
+    super(_InProcessRpcError, self).__init__('{}: {}'.format(code, details))
+    self._code = code
+    self._details = details
+
+  def code(self):
+    return self._code
+
+  def details(self):
+    return self._details
+
+
+class _InProcessServicerContext(object):
+  """The subset of `grpc.ServicerContext` that `ExecutorService` relies on."""
+
+  def __init__(self):
+    self.code = grpc.StatusCode.OK
+    self.details = None
+
+  def set_code(self, code):
+    self.code = code
+
+  def set_details(self, details):
+    self.details = details
+
+
+class _InProcessMethod(object):
+  """Invokes a servicer method directly, in the manner of a unary-unary stub.
+
+  Requests and responses are passed through their wire format, as they would
+  be over a channel, so that the caller and the servicer never share messages.
+  Errors surface as a `grpc.RpcError`, as they would for a gRPC server: with
+  the status code set by the servicer, or `UNKNOWN` if it raised.
+  """
+
+  def __init__(self, method, request_class, response_class, thread_pool):
+    self._method = method
+    self._request_class = request_class
+    self._response_class = response_class
+    self._thread_pool = thread_pool
+
+  def _invoke(self, serialized_request):
+    context = _InProcessServicerContext()
+    try:
+      response = self._method(
+          self._request_class.FromString(serialized_request), context)
+    except Exception as e:  # pylint: disable=broad-except
+      raise _InProcessRpcError(grpc.StatusCode.UNKNOWN,
+                               'Exception calling application: {}'.format(e))
+    if context.code != grpc.StatusCode.OK:
+      raise _InProcessRpcError(context.code, context.details)
+    return self._response_class.FromString(response.SerializeToString())
+
+  def __call__(self, request):
+    return self._invoke(request.SerializeToString())
+
+  def future(self, request):
+    # The request is serialized before returning, as a gRPC stub would, so
+    # the caller is free to modify it once the call has been started.
+    return self._thread_pool.submit(self._invoke, request.SerializeToString())
+
+
+class _InProcessStub(object):
+  """Stands in for an `ExecutorStub`, without going through the network."""
+
+  def __init__(self, servicer, thread_pool):
+    service = executor_pb2.DESCRIPTOR.services_by_name['Executor']
+    for method in service.methods:
+      setattr(
+          self, method.name,
+          _InProcessMethod(
+              getattr(servicer, method.name),
+              getattr(executor_pb2, method.input_type.name),
+              getattr(executor_pb2, method.output_type.name), thread_pool))
+
+
+def _shut_down(service, server_pool, server=None, channel_pool=None):
+  """Releases the resources of a `TestEnv`, without waiting on pending RPCs."""
+  if server is not None:
+    server.stop(0)
+  if channel_pool is not None:
+    channel_pool.close()
+  # The service runs its event loop on a non-daemon thread, which would
+  # otherwise keep the process from exiting. Closing it cancels the pending
+  # coroutines, which releases any in-process calls still waiting on them
+  # before their worker threads are let go.
+  service.close()
+  server_pool.shutdown(wait=False)
+
 
 class TestEnv(object):
   """A test environment that consists of a single client and backend service."""
 
-  def __init__(self, executor):
-    port = portpicker.pick_unused_port()
-    server_pool = logging_pool.pool(max_workers=1)
-    self._server = grpc.server(server_pool)
-    self._server.add_insecure_port('[::]:{}'.format(port))
+  def __init__(self, executor, max_workers=None, in_process=True):
+    """Constructs the test environment.
+
+    Args:
+      executor: The executor to wrap in the `ExecutorService`.
+      max_workers: The number of threads the server uses to handle RPCs, or
+        `None` to default to the number of available cores.
+      in_process: Whether to invoke the service directly, rather than through
+        a gRPC server listening on a local port.
+    """
+    server_pool = futures.ThreadPoolExecutor(
+        max_workers=max_workers or os.cpu_count())
     self._service = executor_service.ExecutorService(executor)
+    self._in_process = in_process
+    if in_process:
+      self._stub = _InProcessStub(self._service, server_pool)
+      self._finalizer = weakref.finalize(self, _shut_down, self._service,
+                                         server_pool)
+      return
+    self._server = grpc.server(server_pool, options=_GRPC_OPTIONS)
+    # Binding to port 0 lets the server pick a free port itself, rather than
+    # probing for one up front and racing to bind it a second time.
+    port = self._server.add_insecure_port('[::]:0')
     executor_pb2_grpc.add_ExecutorServicer_to_server(self._service,
                                                      self._server)
     self._server.start()
-    self._channel = grpc.insecure_channel('localhost:{}'.format(port))
-    self._stub = executor_pb2_grpc.ExecutorStub(self._channel)
+    self._pool = _ChannelPool('localhost:{}'.format(port))
+    # The finalizer only covers environments that are never closed; it must
+    # not hold a reference to `self`, or it would keep the environment alive.
+    self._finalizer = weakref.finalize(self, _shut_down, self._service,
+                                       server_pool, self._server, self._pool)
 
-  def __del__(self):
-    # TODO(b/134543154): Find some way of cleanly disposing of channels that is
-    # consistent between Google-internal and OSS stacks.
-    try:
-      self._channel.close()
-    except AttributeError:
-      # The `.close()` method does not appear to be present in grpcio 1.8.6, so
-      # we have to fall back on explicitly calling the destructor.
-      del self._stub
-      del self._channel
-    self._server.stop(None)
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def close(self):
+    """Shuts down the service, server and channels of this environment."""
+    self._finalizer()
 
   @property
   def stub(self):
-    return self._stub
+    if self._in_process:
+      return self._stub
+    return self._pool.stub()
 
-  def get_value(self, value_id):
-    response = self._stub.Compute(
-        executor_pb2.ComputeRequest(
-            value_ref=executor_pb2.ValueRef(id=value_id)))
+  def get_value(self, value_ref):
+    response = self.stub.Compute(
+        executor_pb2.ComputeRequest(value_ref=value_ref))
     py_typecheck.check_type(response, executor_pb2.ComputeResponse)
     value, _ = executor_service_utils.deserialize_value(response.value)
     return value
 
-
-class ExecutorServiceTest(absltest.TestCase):
+  def get_values(self, value_refs):
+    """Computes the given values concurrently, and returns them in order."""
+    response_futures = [
+        self.stub.Compute.future(executor_pb2.ComputeRequest(value_ref=ref))
+        for ref in value_refs
+    ]
+    values = []
+    for response_future in response_futures:
+      response = response_future.result()
+      py_typecheck.check_type(response, executor_pb2.ComputeResponse)
+      value, _ = executor_service_utils.deserialize_value(response.value)
+      values.append(value)
+    return values
+
+
+# The tests that use the shared environments run both in-process and through
+# a gRPC server and channels, so that the socket path stays covered.
+_ENV_PARAMETERS = (('in_process', True), ('socket', False))
+
+
+class ExecutorServiceTest(parameterized.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    super(ExecutorServiceTest, cls).setUpClass()
+    cls._envs = {
+        in_process: TestEnv(
+            eager_executor.EagerExecutor(), in_process=in_process)
+        for _, in_process in _ENV_PARAMETERS
+    }
+
+  @classmethod
+  def tearDownClass(cls):
+    for env in cls._envs.values():
+      env.close()
+    del cls._envs
+    super(ExecutorServiceTest, cls).tearDownClass()
 
   def test_executor_service_slowly_create_tensor_value(self):
 
@@ -106,7 +330,8 @@ class ExecutorServiceTest(absltest.TestCase):
       async def create_value(self, value, type_spec=None):
         self.status = 'busy'
         self.busy.set()
-        self.done.wait()
+        # Wait on a worker thread, so as not to block the service's event loop.
+        await asyncio.get_event_loop().run_in_executor(None, self.done.wait)
         self.status = 'done'
         return SlowExecutorValue(value, type_spec)
 
@@ -120,65 +345,97 @@ class ExecutorServiceTest(absltest.TestCase):
         raise NotImplementedError
 
     ex = SlowExecutor()
-    env = TestEnv(ex)
-    self.assertEqual(ex.status, 'idle')
-    value_proto, _ = executor_service_utils.serialize_value(10, tf.int32)
-    response = env.stub.CreateValue(
-        executor_pb2.CreateValueRequest(value=value_proto))
-    ex.busy.wait()
-    self.assertEqual(ex.status, 'busy')
-    ex.done.set()
-    value = env.get_value(response.value_ref.id)
-    self.assertEqual(ex.status, 'done')
-    self.assertEqual(value, 10)
+    # Makes sure the worker thread waiting on `done` is released, even if the
+    # test fails before it gets there.
+    self.addCleanup(ex.done.set)
+    with TestEnv(ex, in_process=False) as env:
+      self.assertEqual(ex.status, 'idle')
+      value_proto = _create_value_proto(10, tf.int32)
+      response = env.stub.CreateValue(
+          executor_pb2.CreateValueRequest(value=value_proto))
+      ex.busy.wait()
+      self.assertEqual(ex.status, 'busy')
+      ex.done.set()
+      value = env.get_value(response.value_ref)
+      self.assertEqual(ex.status, 'done')
+      self.assertEqual(value, 10)
+
+  def test_executor_service_close_stops_event_loop_thread(self):
+    service = executor_service.ExecutorService(eager_executor.EagerExecutor())
+    service.close()
+    self.assertFalse(service._thread.is_alive())
+    # A second call finds the event loop already closed, and does nothing.
+    service.close()
+    self.assertFalse(service._thread.is_alive())
+
+  def test_executor_service_close_cancels_pending_values(self):
+
+    class HangingExecutor(executor_base.Executor):
+
+      async def create_value(self, value, type_spec=None):
+        await asyncio.Event().wait()
+
+      async def create_call(self, comp, arg=None):
+        raise NotImplementedError
+
+      async def create_tuple(self, elements):
+        raise NotImplementedError
+
+      async def create_selection(self, source, index=None, name=None):
+        raise NotImplementedError
 
-  def test_executor_service_create_tensor_value(self):
-    env = TestEnv(eager_executor.EagerExecutor())
-    value_proto, _ = executor_service_utils.serialize_value(
-        tf.constant(10.0).numpy(), tf.float32)
+    service = executor_service.ExecutorService(HangingExecutor())
+    response = service.CreateValue(
+        executor_pb2.CreateValueRequest(
+            value=_create_value_proto(10, tf.int32)),
+        _InProcessServicerContext())
+    service.close()
+    with self.assertRaises(futures.CancelledError):
+      service.Compute(
+          executor_pb2.ComputeRequest(value_ref=response.value_ref),
+          _InProcessServicerContext())
+
+  @parameterized.named_parameters(*_ENV_PARAMETERS)
+  def test_executor_service_create_tensor_value(self, in_process):
+    env = self._envs[in_process]
+    value_proto = _create_value_proto(10.0, tf.float32)
     response = env.stub.CreateValue(
         executor_pb2.CreateValueRequest(value=value_proto))
     self.assertIsInstance(response, executor_pb2.CreateValueResponse)
-    value_id = str(response.value_ref.id)
-    value = env.get_value(value_id)
+    value = env.get_value(response.value_ref)
     self.assertEqual(value, 10.0)
-    del env
-
-  def test_executor_service_create_no_arg_computation_value_and_call(self):
-    env = TestEnv(eager_executor.EagerExecutor())
 
-    @computations.tf_computation
-    def comp():
-      return tf.constant(10)
-
-    value_proto, _ = executor_service_utils.serialize_value(comp)
+  @parameterized.named_parameters(*_ENV_PARAMETERS)
+  def test_executor_service_create_no_arg_computation_value_and_call(
+      self, in_process):
+    env = self._envs[in_process]
+    value_proto = _create_value_proto(_return_ten)
     response = env.stub.CreateValue(
         executor_pb2.CreateValueRequest(value=value_proto))
     self.assertIsInstance(response, executor_pb2.CreateValueResponse)
     response = env.stub.CreateCall(
         executor_pb2.CreateCallRequest(function_ref=response.value_ref))
     self.assertIsInstance(response, executor_pb2.CreateCallResponse)
-    value_id = str(response.value_ref.id)
-    value = env.get_value(value_id)
+    value = env.get_value(response.value_ref)
     self.assertEqual(value, 10)
-    del env
-
-  def test_executor_service_create_one_arg_computation_value_and_call(self):
-    env = TestEnv(eager_executor.EagerExecutor())
 
-    @computations.tf_computation(tf.int32)
-    def comp(x):
-      return tf.add(x, 1)
-
-    value_proto, _ = executor_service_utils.serialize_value(comp)
-    response = env.stub.CreateValue(
-        executor_pb2.CreateValueRequest(value=value_proto))
+  @parameterized.named_parameters(*_ENV_PARAMETERS)
+  def test_executor_service_create_one_arg_computation_value_and_call(
+      self, in_process):
+    env = self._envs[in_process]
+    # The function and the argument don't depend on each other, so they are
+    # created concurrently.
+    comp_future = env.stub.CreateValue.future(
+        executor_pb2.CreateValueRequest(value=_create_value_proto(_add_one)))
+    arg_future = env.stub.CreateValue.future(
+        executor_pb2.CreateValueRequest(
+            value=_create_value_proto(10, tf.int32)))
+
+    response = comp_future.result()
     self.assertIsInstance(response, executor_pb2.CreateValueResponse)
     comp_ref = response.value_ref
 
-    value_proto, _ = executor_service_utils.serialize_value(10, tf.int32)
-    response = env.stub.CreateValue(
-        executor_pb2.CreateValueRequest(value=value_proto))
+    response = arg_future.result()
     self.assertIsInstance(response, executor_pb2.CreateValueResponse)
     arg_ref = response.value_ref
 
@@ -186,27 +443,25 @@ class ExecutorServiceTest(absltest.TestCase):
         executor_pb2.CreateCallRequest(
             function_ref=comp_ref, argument_ref=arg_ref))
     self.assertIsInstance(response, executor_pb2.CreateCallResponse)
-    value_id = str(response.value_ref.id)
-    value = env.get_value(value_id)
+    value = env.get_value(response.value_ref)
     self.assertEqual(value, 11)
-    del env
-
-  def test_executor_service_create_and_select_from_tuple(self):
-    env = TestEnv(eager_executor.EagerExecutor())
 
-    value_proto, _ = executor_service_utils.serialize_value(10, tf.int32)
+  @parameterized.named_parameters(*_ENV_PARAMETERS)
+  def test_executor_service_create_and_select_from_tuple(self, in_process):
+    env = self._envs[in_process]
+    value_proto = _create_value_proto(10, tf.int32)
     response = env.stub.CreateValue(
         executor_pb2.CreateValueRequest(value=value_proto))
     self.assertIsInstance(response, executor_pb2.CreateValueResponse)
     ten_ref = response.value_ref
-    self.assertEqual(env.get_value(ten_ref.id), 10)
+    self.assertEqual(env.get_value(ten_ref), 10)
 
-    value_proto, _ = executor_service_utils.serialize_value(20, tf.int32)
+    value_proto = _create_value_proto(20, tf.int32)
     response = env.stub.CreateValue(
         executor_pb2.CreateValueRequest(value=value_proto))
     self.assertIsInstance(response, executor_pb2.CreateValueResponse)
     twenty_ref = response.value_ref
-    self.assertEqual(env.get_value(twenty_ref.id), 20)
+    self.assertEqual(env.get_value(twenty_ref), 20)
 
     response = env.stub.CreateTuple(
         executor_pb2.CreateTupleRequest(element=[
@@ -217,20 +472,38 @@ class ExecutorServiceTest(absltest.TestCase):
         ]))
     self.assertIsInstance(response, executor_pb2.CreateTupleResponse)
     tuple_ref = response.value_ref
-    self.assertEqual(str(env.get_value(tuple_ref.id)), '<a=10,b=20>')
-
-    for arg_name, arg_val, result_val in [('name', 'a', 10), ('name', 'b', 20),
-                                          ('index', 0, 10), ('index', 1, 20)]:
-      response = env.stub.CreateSelection(
-          executor_pb2.CreateSelectionRequest(
-              source_ref=tuple_ref, **{arg_name: arg_val}))
+    self.assertEqual(str(env.get_value(tuple_ref)), '<a=10,b=20>')
+
+    selections = [('name', 'a', 10), ('name', 'b', 20), ('index', 0, 10),
+                  ('index', 1, 20)]
+    # Both kinds of stub serialize the request when the call is started, so
+    # a single scratch request can be reused for all the selections.
+    request = executor_pb2.CreateSelectionRequest()
+    request.source_ref.CopyFrom(tuple_ref)
+    response_futures = []
+    for arg_name, arg_val, _ in selections:
+      request.ClearField('name')
+      request.ClearField('index')
+      setattr(request, arg_name, arg_val)
+      response_futures.append(env.stub.CreateSelection.future(request))
+    selection_refs = []
+    for response_future in response_futures:
+      response = response_future.result()
       self.assertIsInstance(response, executor_pb2.CreateSelectionResponse)
-      selection_ref = response.value_ref
-      self.assertEqual(env.get_value(selection_ref.id), result_val)
+      selection_refs.append(response.value_ref)
+    self.assertEqual(
+        env.get_values(selection_refs),
+        [result_val for _, _, result_val in selections])
+
 
-    del env
+  @parameterized.named_parameters(*_ENV_PARAMETERS)
+  def test_executor_service_compute_unknown_value_raises_rpc_error(
+      self, in_process):
+    env = self._envs[in_process]
+    with self.assertRaises(grpc.RpcError) as context:
+      env.get_value(executor_pb2.ValueRef(id='unknown'))
+    self.assertEqual(context.exception.code(), grpc.StatusCode.UNKNOWN)
 
 
 if __name__ == '__main__':
-  tf.compat.v1.enable_v2_behavior()
   absltest.main()
@@ -275,6 +275,38 @@ def extract_intrinsics(comp):
   return transformation_utils.transform_postorder(comp, _transform)
 
 
+def _inline_block_local(comp, symbol_tree, variable_names):
+  """Inlines `comp` if it is a whitelisted block variable or local binding."""
+
+  def _should_inline_variable(name):
+    return variable_names is None or name in variable_names
+
+  if isinstance(comp, computation_building_blocks.Reference):
+    if not _should_inline_variable(comp.name):
+      return comp, False
+    try:
+      value = symbol_tree.get_payload_with_name(comp.name).value
+    except NameError:
+      # This reference is unbound
+      value = None
+    # This identifies a variable bound by a Block as opposed to a Lambda.
+    if value is not None:
+      return value, True
+    return comp, False
+  elif isinstance(comp, computation_building_blocks.Block):
+    if not any(_should_inline_variable(name) for name, _ in comp.locals):
+      return comp, False
+    variables = [(name, value)
+                 for name, value in comp.locals
+                 if not _should_inline_variable(name)]
+    if not variables:
+      comp = comp.result
+    else:
+      comp = computation_building_blocks.Block(variables, comp.result)
+    return comp, True
+  return comp, False
+
+
 def inline_block_locals(comp, variable_names=None):
   """Inlines the block variables in `comp` whitelisted by `variable_names`.
 
@@ -297,39 +329,56 @@ def inline_block_locals(comp, variable_names=None):
   if variable_names is not None:
     py_typecheck.check_type(variable_names, (list, tuple, set))
 
-  def _should_inline_variable(name):
-    return variable_names is None or name in variable_names
+  def _transform(comp, symbol_tree):
+    """Returns a new transformed computation or `comp`."""
+    return _inline_block_local(comp, symbol_tree, variable_names)
 
-  def _should_transform(comp):
-    return ((isinstance(comp, computation_building_blocks.Reference) and
-             _should_inline_variable(comp.name)) or
-            (isinstance(comp, computation_building_blocks.Block) and
-             any(_should_inline_variable(name) for name, _ in comp.locals)))
+  symbol_tree = transformation_utils.SymbolTree(
+      transformation_utils.ReferenceCounter)
+  return transformation_utils.transform_postorder_with_symbol_bindings(
+      comp, _transform, symbol_tree)
+
+
+def inline_block_locals_and_simplify(comp, variable_names=None):
+  """Inlines block variables, and removes identities and tuple selections.
+
+  This applies the rewrites of `remove_mapped_or_applied_identity`,
+  `inline_block_locals` and `replace_selection_from_tuple_with_element`, in
+  that order, to each node during a single postorder traversal of `comp`.
+
+  Since the children of a node are fully transformed before the node itself is
+  visited, this is stronger than calling the three transformations one after
+  another. For example, in `(let f=(x -> x) in federated_apply(<f,data>))` the
+  reference `f` is inlined before the call is visited, so the applied identity
+  is removed as well, leaving `data`; calling the three transformations in
+  sequence would leave `federated_apply(<(x -> x),data>)`.
+
+  Args:
+    comp: The computation building block in which to perform the
+      transformations. The names of lambda parameters and block variables in
+      `comp` must be unique.
+    variable_names: A Python list, tuple, or set representing the whitelist of
+      variable names to inline; or None if all variables should be inlined.
+
+  Returns:
+    A new computation with the transformations applied or the original `comp`.
+
+  Raises:
+    ValueError: If `comp` contains variables with non-unique names.
+  """
+  py_typecheck.check_type(comp,
+                          computation_building_blocks.ComputationBuildingBlock)
+  check_has_unique_names(comp)
+  if variable_names is not None:
+    py_typecheck.check_type(variable_names, (list, tuple, set))
 
   def _transform(comp, symbol_tree):
     """Returns a new transformed computation or `comp`."""
-    if not _should_transform(comp):
-      return comp, False
-    if isinstance(comp, computation_building_blocks.Reference):
-      try:
-        value = symbol_tree.get_payload_with_name(comp.name).value
-      except NameError:
-        # This reference is unbound
-        value = None
-      # This identifies a variable bound by a Block as opposed to a Lambda.
-      if value is not None:
-        return value, True
-      return comp, False
-    elif isinstance(comp, computation_building_blocks.Block):
-      variables = [(name, value)
-                   for name, value in comp.locals
-                   if not _should_inline_variable(name)]
-      if not variables:
-        comp = comp.result
-      else:
-        comp = computation_building_blocks.Block(variables, comp.result)
-      return comp, True
-    return comp, False
+    comp, identity_removed = _remove_mapped_or_applied_identity(comp)
+    comp, local_inlined = _inline_block_local(comp, symbol_tree,
+                                              variable_names)
+    comp, selection_replaced = _replace_selection_from_tuple_with_element(comp)
+    return comp, identity_removed or local_inlined or selection_replaced
 
   symbol_tree = transformation_utils.SymbolTree(
       transformation_utils.ReferenceCounter)
@@ -777,6 +826,22 @@ def merge_tuple_intrinsics(comp, uri):
   return transformation_utils.transform_postorder(comp, _transform)
 
 
+def _remove_mapped_or_applied_identity(comp):
+  """Removes `comp` if it is a mapped or applied identity function."""
+  if (isinstance(comp, computation_building_blocks.Call) and
+      isinstance(comp.function, computation_building_blocks.Intrinsic) and
+      comp.function.uri in (
+          intrinsic_defs.FEDERATED_MAP.uri,
+          intrinsic_defs.FEDERATED_MAP_ALL_EQUAL.uri,
+          intrinsic_defs.FEDERATED_APPLY.uri,
+          intrinsic_defs.SEQUENCE_MAP.uri,
+      )):
+    called_function = comp.argument[0]
+    if computation_building_block_utils.is_identity_function(called_function):
+      return comp.argument[1], True
+  return comp, False
+
+
 def remove_mapped_or_applied_identity(comp):
   r"""Removes all the mapped or applied identity functions in `comp`.
 
@@ -811,29 +876,8 @@ def remove_mapped_or_applied_identity(comp):
   """
   py_typecheck.check_type(comp,
                           computation_building_blocks.ComputationBuildingBlock)
-
-  def _should_transform(comp):
-    """Returns `True` if `comp` is a mapped or applied identity function."""
-    if (isinstance(comp, computation_building_blocks.Call) and
-        isinstance(comp.function, computation_building_blocks.Intrinsic) and
-        comp.function.uri in (
-            intrinsic_defs.FEDERATED_MAP.uri,
-            intrinsic_defs.FEDERATED_MAP_ALL_EQUAL.uri,
-            intrinsic_defs.FEDERATED_APPLY.uri,
-            intrinsic_defs.SEQUENCE_MAP.uri,
-        )):
-      called_function = comp.argument[0]
-      return computation_building_block_utils.is_identity_function(
-          called_function)
-    return False
-
-  def _transform(comp):
-    if not _should_transform(comp):
-      return comp, False
-    transformed_comp = comp.argument[1]
-    return transformed_comp, True
-
-  return transformation_utils.transform_postorder(comp, _transform)
+  return transformation_utils.transform_postorder(
+      comp, _remove_mapped_or_applied_identity)
 
 
 def replace_called_lambda_with_block(comp):
@@ -935,6 +979,20 @@ def replace_intrinsic_with_callable(comp, uri, body, context_stack):
   return transformation_utils.transform_postorder(comp, _transform)
 
 
+def _replace_selection_from_tuple_with_element(comp):
+  """Replaces `comp` if it is a selection from a tuple."""
+  if not (isinstance(comp, computation_building_blocks.Selection) and
+          isinstance(comp.source, computation_building_blocks.Tuple)):
+    return comp, False
+  if comp.name is not None:
+    named_type_signatures = anonymous_tuple.to_elements(
+        comp.source.type_signature)
+    index = [x[0] for x in named_type_signatures].index(comp.name)
+  else:
+    index = comp.index
+  return comp.source[index], True
+
+
 def replace_selection_from_tuple_with_element(comp):
   r"""Replaces any selection from a tuple with the underlying tuple element.
 
@@ -962,25 +1020,8 @@ def replace_selection_from_tuple_with_element(comp):
   """
   py_typecheck.check_type(comp,
                           computation_building_blocks.ComputationBuildingBlock)
-
-  def _should_transform(comp):
-    return (isinstance(comp, computation_building_blocks.Selection) and
-            isinstance(comp.source, computation_building_blocks.Tuple))
-
-  def _get_index_from_name(selection_name, tuple_type_signature):
-    named_type_signatures = anonymous_tuple.to_elements(tuple_type_signature)
-    return [x[0] for x in named_type_signatures].index(selection_name)
-
-  def _transform(comp):
-    if not _should_transform(comp):
-      return comp, False
-    if comp.name is not None:
-      index = _get_index_from_name(comp.name, comp.source.type_signature)
-    else:
-      index = comp.index
-    return comp.source[index], True
-
-  return transformation_utils.transform_postorder(comp, _transform)
+  return transformation_utils.transform_postorder(
+      comp, _replace_selection_from_tuple_with_element)
 
 
 def uniquify_compiled_computation_names(comp):
@@ -1195,6 +1195,152 @@ class InlineBlockLocalsTest(absltest.TestCase):
     self.assertFalse(modified)
 
 
+class InlineBlockLocalsAndSimplifyTest(absltest.TestCase):
+
+  def test_raises_type_error_with_none_comp(self):
+    with self.assertRaises(TypeError):
+      transformations.inline_block_locals_and_simplify(None)
+
+  def test_raises_type_error_with_wrong_type_variable_names(self):
+    block = computation_test_utils.create_identity_block_with_dummy_data(
+        variable_name='a')
+    comp = block
+    with self.assertRaises(TypeError):
+      transformations.inline_block_locals_and_simplify(comp, 1)
+
+  def test_raises_value_error_with_non_unique_variable_names(self):
+    data = computation_building_blocks.Data('data', tf.int32)
+    block = computation_building_blocks.Block([('a', data), ('a', data)], data)
+    with self.assertRaises(ValueError):
+      transformations.inline_block_locals_and_simplify(block)
+
+  def test_noops_with_unbound_reference(self):
+    ref = computation_building_blocks.Reference('x', tf.int32)
+    lambda_binding_y = computation_building_blocks.Lambda('y', tf.float32, ref)
+
+    transformed_comp, modified = transformations.inline_block_locals_and_simplify(
+        lambda_binding_y)
+
+    self.assertEqual(
+        computation_building_blocks.compact_representation(transformed_comp),
+        '(y -> x)')
+    self.assertFalse(modified)
+
+  def test_removes_mapped_or_applied_identity(self):
+    call = computation_test_utils.create_dummy_called_federated_apply(
+        parameter_name='a')
+    comp = call
+
+    transformed_comp, modified = transformations.inline_block_locals_and_simplify(
+        comp)
+
+    self.assertEqual(
+        computation_building_blocks.compact_representation(transformed_comp),
+        'data')
+    self.assertEqual(transformed_comp.type_signature, comp.type_signature)
+    self.assertTrue(modified)
+
+  def test_inlines_block_variable_and_replaces_selection_from_tuple(self):
+    data = computation_building_blocks.Data('data', tf.int32)
+    tup = computation_building_blocks.Tuple([data])
+    ref = computation_building_blocks.Reference('a', tup.type_signature)
+    sel = computation_building_blocks.Selection(ref, index=0)
+    block = computation_building_blocks.Block([('a', tup)], sel)
+    comp = block
+
+    transformed_comp, modified = transformations.inline_block_locals_and_simplify(
+        comp)
+
+    self.assertEqual(
+        computation_building_blocks.compact_representation(comp),
+        '(let a=<data> in a[0])')
+    self.assertEqual(
+        computation_building_blocks.compact_representation(transformed_comp),
+        'data')
+    self.assertEqual(transformed_comp.type_signature, comp.type_signature)
+    self.assertTrue(modified)
+
+  def test_inlines_block_variable_and_removes_applied_identity(self):
+    call = computation_test_utils.create_dummy_called_federated_apply(
+        parameter_name='a')
+    ref = computation_building_blocks.Reference('b', call.type_signature)
+    block = computation_building_blocks.Block([('b', call)], ref)
+    comp = block
+
+    transformed_comp, modified = transformations.inline_block_locals_and_simplify(
+        comp)
+
+    self.assertEqual(
+        computation_building_blocks.compact_representation(transformed_comp),
+        'data')
+    self.assertEqual(transformed_comp.type_signature, comp.type_signature)
+    self.assertTrue(modified)
+
+  def test_removes_applied_identity_bound_by_block(self):
+    fn = computation_test_utils.create_identity_function('x', tf.int32)
+    ref = computation_building_blocks.Reference('f', fn.type_signature)
+    arg_type = computation_types.FederatedType(tf.int32, placements.SERVER)
+    arg = computation_building_blocks.Data('data', arg_type)
+    call = computation_constructing_utils.create_federated_apply(ref, arg)
+    block = computation_building_blocks.Block([('f', fn)], call)
+    comp = block
+
+    sequential_comp, _ = transformations.remove_mapped_or_applied_identity(
+        comp)
+    sequential_comp, _ = transformations.inline_block_locals(sequential_comp)
+    sequential_comp, _ = transformations.replace_selection_from_tuple_with_element(
+        sequential_comp)
+    transformed_comp, modified = transformations.inline_block_locals_and_simplify(
+        comp)
+
+    self.assertEqual(
+        computation_building_blocks.compact_representation(comp),
+        '(let f=(x -> x) in {}(<f,data>))'.format(
+            intrinsic_defs.FEDERATED_APPLY.uri))
+    self.assertEqual(
+        computation_building_blocks.compact_representation(sequential_comp),
+        '{}(<(x -> x),data>)'.format(intrinsic_defs.FEDERATED_APPLY.uri))
+    self.assertEqual(
+        computation_building_blocks.compact_representation(transformed_comp),
+        'data')
+    self.assertEqual(transformed_comp.type_signature, comp.type_signature)
+    self.assertTrue(modified)
+
+  def test_inlines_whitelisted_block_variables(self):
+    data = computation_building_blocks.Data('data', tf.int32)
+    ref_1 = computation_building_blocks.Reference('a', tf.int32)
+    ref_2 = computation_building_blocks.Reference('b', tf.int32)
+    tup = computation_building_blocks.Tuple((ref_1, ref_2))
+    block = computation_building_blocks.Block((('a', data), ('b', data)), tup)
+    comp = block
+
+    transformed_comp, modified = transformations.inline_block_locals_and_simplify(
+        comp, variable_names=('a',))
+
+    self.assertEqual(
+        computation_building_blocks.compact_representation(comp),
+        '(let a=data,b=data in <a,b>)')
+    self.assertEqual(
+        computation_building_blocks.compact_representation(transformed_comp),
+        '(let b=data in <data,b>)')
+    self.assertEqual(transformed_comp.type_signature, comp.type_signature)
+    self.assertTrue(modified)
+
+  def test_does_not_inline_block_variables(self):
+    block = computation_test_utils.create_identity_block_with_dummy_data(
+        variable_name='a')
+    comp = block
+
+    transformed_comp, modified = transformations.inline_block_locals_and_simplify(
+        comp, variable_names=('b',))
+
+    self.assertEqual(
+        computation_building_blocks.compact_representation(transformed_comp),
+        '(let a=data in a)')
+    self.assertEqual(transformed_comp.type_signature, comp.type_signature)
+    self.assertFalse(modified)
+
+
 class MergeChainedBlocksTest(absltest.TestCase):
 
   def test_fails_on_none(self):
@@ -19,11 +19,14 @@ from __future__ import division
 from __future__ import print_function
 
 import asyncio
+import atexit
+import threading
 
 from absl.testing import absltest
 
 import tensorflow as tf
 
+from tensorflow_federated.python.common_libs import test
 from tensorflow_federated.python.core.api import computations
 from tensorflow_federated.python.core.api import intrinsics
 from tensorflow_federated.python.core.impl import computation_building_blocks
@@ -32,6 +35,8 @@ from tensorflow_federated.python.core.impl import transformations
 from tensorflow_federated.python.core.impl import transforming_executor
 from tensorflow_federated.python.core.impl import type_constructors
 
+test.enable_v2_behavior()
+
 
 class FakeEx(executor_base.Executor):
 
@@ -49,9 +54,19 @@ class FakeEx(executor_base.Executor):
     raise NotImplementedError
 
 
+# A single event loop, running on a dedicated thread, that is shared by all
+# the tests in this module.
+_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, daemon=True).start()
+atexit.register(lambda: _LOOP.call_soon_threadsafe(_LOOP.stop))
+
+
+_FAKE_EX = FakeEx()
+
+
 def _test_create_value(val, transform_fn):
-  ex = transforming_executor.TransformingExecutor(transform_fn, FakeEx())
-  return asyncio.get_event_loop().run_until_complete(ex.create_value(val))
+  ex = transforming_executor.TransformingExecutor(transform_fn, _FAKE_EX)
+  return asyncio.run_coroutine_threadsafe(ex.create_value(val), _LOOP).result()
 
 
 @computations.federated_computation(tf.int32)
@@ -59,40 +74,39 @@ def _identity(x):
   return x
 
 
+@computations.federated_computation(type_constructors.at_server(tf.int32))
+def _apply_identity_at_server(x):
+  return intrinsics.federated_apply(_identity, x)
+
+
+@computations.federated_computation(type_constructors.at_server(tf.int32))
+def _zip_at_server(x):
+  return intrinsics.federated_zip([x, x])
+
+
 class TransformingExecutorTest(absltest.TestCase):
 
   def test_with_removal_of_identity_mapping(self):
 
-    @computations.federated_computation(type_constructors.at_server(tf.int32))
-    def comp(x):
-      return intrinsics.federated_apply(_identity, x)
-
     def transformation_fn(x):
       x, _ = transformations.remove_mapped_or_applied_identity(x)
       return x
 
     self.assertEqual(
-        _test_create_value(comp, transformation_fn),
+        _test_create_value(_apply_identity_at_server, transformation_fn),
         '(FEDERATED_arg -> FEDERATED_arg)')
 
   def test_with_inlining_of_blocks(self):
 
-    @computations.federated_computation(type_constructors.at_server(tf.int32))
-    def comp(x):
-      return intrinsics.federated_zip([x, x])
-
     # TODO(b/134543154): Slide in something more powerful so that this test
     # doesn't break when the implementation changes; for now, this will do.
     def transformation_fn(x):
-      x, _ = transformations.remove_mapped_or_applied_identity(x)
-      x, _ = transformations.inline_block_locals(x)
-      x, _ = transformations.replace_selection_from_tuple_with_element(x)
+      x, _ = transformations.inline_block_locals_and_simplify(x)
       return x
 
     self.assertIn('federated_zip_at_server(<FEDERATED_arg,FEDERATED_arg>)',
-                  _test_create_value(comp, transformation_fn))
+                  _test_create_value(_zip_at_server, transformation_fn))
 
 
 if __name__ == '__main__':
-  tf.compat.v1.enable_v2_behavior()
   absltest.main()